@@ -1,12 +1,18 @@
 # app.py
 import streamlit as st
+import ast
 import json
+import hashlib
 import os
 import re
 import base64
-from typing import Dict, List
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
 from datetime import datetime
 from types import SimpleNamespace
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 
 
@@ -19,6 +25,20 @@ except Exception:
     GroqAvailable = False
     Groq = None  # for typing / checks below
 
+# --- Faster JSON decoding for model responses when orjson is installed ---
+# (orjson.JSONDecodeError subclasses json.JSONDecodeError, so existing handlers still apply)
+try:
+    import orjson as _json  # type: ignore
+except ImportError:
+    _json = json
+
+# --- Optional persistent response cache (survives app restarts); skipped if diskcache is missing ---
+try:
+    import diskcache  # type: ignore
+    _CACHE = diskcache.Cache(".review_cache")
+except Exception:
+    _CACHE = None
+
 # --- Mock Groq client to allow UI testing when the real SDK isn't available ---
 class MockGroq:
     def __init__(self, api_key: str = ""):
@@ -29,7 +49,13 @@ class MockGroq:
             )
         )
 
-    def _mock_create(self, messages=None, model=None, temperature=None, max_tokens=None):
+    @staticmethod
+    def _as_stream(content: str, chunk_size: int = 24):
+        for start in range(0, len(content), chunk_size):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content[start:start + chunk_size]))])
+
+    def _mock_create(self, messages=None, model=None, temperature=None, max_tokens=None, stream=False, response_format=None,
+                     top_p=None, seed=None):
         user_msg = ""
         if messages:
             for m in messages:
@@ -37,28 +63,56 @@ class MockGroq:
                     user_msg = m.get("content", "")
                     break
 
-        if "Respond only with valid JSON" in user_msg or "Please provide a response in the following JSON format" in user_msg:
+        batch = re.search(r'"items" array of exactly (\d+) objects', user_msg)
+        if batch or "Respond only with valid JSON" in user_msg or "Please provide a response in the following JSON format" in user_msg:
             mock_json = {
                 "positive_rephrasing": "Nice work — the logic is solid. We can make this clearer and slightly more efficient by simplifying the loop and improving naming.",
                 "the_why": "Combining boolean checks and using idiomatic constructs improves readability and performance for larger lists.",
                 "suggested_improvement": "def get_active_users(users):\n    return [user for user in users if user.is_active and user.profile_complete]",
                 "resource_link": "https://docs.python.org/3/tutorial/datastructures.html#list-comprehensions"
             }
+            if batch:
+                mock_json = {"items": [mock_json] * int(batch.group(1))}
+            if stream:
+                return self._as_stream(json.dumps(mock_json))
             return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(mock_json)))])
         else:
             summary_text = (
                 "Great work! You've implemented functional logic and with a few changes (readability, naming, and "
                 "idiomatic constructs) the code will be more maintainable and efficient. Keep iterating!"
             )
+            if stream:
+                return self._as_stream(summary_text)
             return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=summary_text))])
 
+# --- The mock is stateless, so a single instance serves every reviewer ---
+_SHARED_MOCK = MockGroq("")
+
 # --- Use the real Groq if available, otherwise the MockGroq ---
 GroqClientClass = Groq if GroqAvailable else MockGroq
 
+# --- One client per API key, so the underlying HTTP connection pool stays warm ---
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _get_groq_client(api_key: str):
+    if GroqAvailable and Groq is not None:
+        try:
+            return Groq(api_key=api_key)
+        except Exception:
+            return _SHARED_MOCK
+    return _SHARED_MOCK
+
 # ------------------- Page config & CSS (improved color scheme) -------------------
+@st.cache_resource(show_spinner=False)
+def _load_logo(path: str = "CodeRev.png"):
+    # Read the logo from disk once per server process instead of once per session
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
 st.set_page_config(
     page_title="CodeRev",
-    page_icon="CodeRev.png",
+    page_icon=_load_logo() or "💬",
     layout="wide",
     initial_sidebar_state="expanded"
 )
@@ -174,72 +228,84 @@ a {
 }
 </style>
 """
+# Streamlit drops any element a rerun doesn't emit again, so the stylesheet has to be
+# sent on every rerun; minify it once at import to keep that payload small.
+CUSTOM_CSS = re.sub(r"\s*([{};:,>])\s*", r"\1", re.sub(r"\s+", " ", re.sub(r"/\*.*?\*/", "", CUSTOM_CSS, flags=re.S))).strip()
 st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
-# ------------------- Main App Logic -------------------
-class EmpatheticCodeReviewer:
-    def __init__(self, groq_api_key: str):
-        if GroqAvailable and Groq is not None:
-            try:
-                self.client = Groq(api_key=groq_api_key)
-            except Exception:
-                self.client = MockGroq(groq_api_key)
-        else:
-            self.client = MockGroq(groq_api_key)
-        self.model = "llama3-8b-8192"
+HEADER_HTML = """
+<div class="main-header">
+    <h1> CodeRev</h1>
+    <p><strong>Transforming Critical Feedback into Constructive Growth</strong></p>
+    <p style="opacity:0.9;">Turn blunt comments into supportive, educational guidance using generative AI.</p>
+</div>
+"""
 
-    def analyze_comment_severity(self, comment: str) -> str:
-        harsh_indicators = ["bad", "wrong", "terrible", "awful", "stupid", "inefficient", "don't", "never", "horrible"]
-        neutral_indicators = ["consider", "might", "could", "suggest", "perhaps"]
-        comment_lower = comment.lower()
-        harsh_count = sum(1 for indicator in harsh_indicators if indicator in comment_lower)
-        neutral_count = sum(1 for indicator in neutral_indicators if indicator in comment_lower)
-        if harsh_count > 0:
-            return "harsh"
-        elif neutral_count > 0:
-            return "neutral"
-        else:
-            return "constructive"
+# ------------------- Language detection patterns (compiled once at import) -------------------
+LANGUAGE_PATTERNS = {
+    "python": [r"def\s+\w+\s*\(", r"import\s+\w+", r"from\s+\w+\s+import", r":\s*$"],
+    "javascript": [r"function\s+\w+\s*\(", r"=>\s*{", r"var\s+\w+", r"let\s+\w+", r"const\s+\w+"],
+    "java": [r"public\s+class", r"private\s+\w+", r"public\s+static\s+void\s+main"],
+    "cpp": [r"#include\s*<", r"int\s+main\s*\(", r"std::", r"cout\s*<<"],
+    "c": [r"#include\s*<", r"int\s+main\s*\(", r"printf\s*\("],
+    "go": [r"func\s+\w+\s*\(", r"package\s+\w+", r"import\s*\("],
+    "rust": [r"fn\s+\w+\s*\(", r"use\s+\w+", r"let\s+mut"],
+    "php": [r"<\?php", r"function\s+\w+\s*\(", r"\$\w+"],
+}
+# One alternation with a named group per language, so a snippet is scanned in a single pass.
+# Where two languages share a pattern, the match is credited to the one listed first.
+LANGUAGE_RE = re.compile(
+    "|".join(f"(?P<{lang}>{'|'.join(patterns)})" for lang, patterns in LANGUAGE_PATTERNS.items()),
+    re.MULTILINE,
+)
 
-    def get_language_from_code(self, code_snippet: str) -> str:
-        language_patterns = {
-            "python": [r"def\s+\w+\s*\(", r"import\s+\w+", r"from\s+\w+\s+import", r":\s*$"],
-            "javascript": [r"function\s+\w+\s*\(", r"=>\s*{", r"var\s+\w+", r"let\s+\w+", r"const\s+\w+"],
-            "java": [r"public\s+class", r"private\s+\w+", r"public\s+static\s+void\s+main"],
-            "cpp": [r"#include\s*<", r"int\s+main\s*\(", r"std::", r"cout\s*<<"],
-            "c": [r"#include\s*<", r"int\s+main\s*\(", r"printf\s*\("],
-            "go": [r"func\s+\w+\s*\(", r"package\s+\w+", r"import\s*\("],
-            "rust": [r"fn\s+\w+\s*\(", r"use\s+\w+", r"let\s+mut"],
-            "php": [r"<\?php", r"function\s+\w+\s*\(", r"\$\w+"],
-        }
-        for lang, patterns in language_patterns.items():
-            if any(re.search(pattern, code_snippet, re.MULTILINE) for pattern in patterns):
-                return lang
-        return "python"
+# ------------------- Prompt fragments -------------------
+TONE_INSTRUCTION = {
+    "harsh": "extra gentle and encouraging, as the original comment was quite direct and potentially discouraging",
+    "neutral": "supportive and educational with a collaborative tone",
+    "constructive": "warm, collaborative, and appreciative of the existing effort"
+}
 
-    def generate_empathetic_feedback(self, code_snippet: str, original_comment: str, language: str, severity: str) -> Dict[str, str]:
-        tone_instruction = {
-            "harsh": "extra gentle and encouraging, as the original comment was quite direct and potentially discouraging",
-            "neutral": "supportive and educational with a collaborative tone",
-            "constructive": "warm, collaborative, and appreciative of the existing effort"
-        }[severity]
-
-        resource_examples = {
-            "python": "Python documentation (docs.python.org), PEP 8 style guide",
-            "javascript": "MDN Web Docs, JavaScript.info, ECMAScript specifications",
-            "java": "Oracle Java documentation, Java Code Conventions",
-            "cpp": "cppreference.com, ISO C++ guidelines",
-            "c": "C standard documentation, K&R C book references",
-            "go": "Go documentation (golang.org), Effective Go",
-            "rust": "The Rust Book, Rust by Example",
-            "php": "PHP Manual, PSR standards"
-        }
-
-        # sanitize code snippet so triple-backticks inside it won't break the prompt formatting
-        safe_code = code_snippet.replace("```", "`\u200b``")
-
-        # Double braces {{ }} produce literal braces in the f-string. The inner {resource_examples...} is evaluated.
-        prompt = f"""
+RESOURCE_EXAMPLES = {
+    "python": "Python documentation (docs.python.org), PEP 8 style guide",
+    "javascript": "MDN Web Docs, JavaScript.info, ECMAScript specifications",
+    "java": "Oracle Java documentation, Java Code Conventions",
+    "cpp": "cppreference.com, ISO C++ guidelines",
+    "c": "C standard documentation, K&R C book references",
+    "go": "Go documentation (golang.org), Effective Go",
+    "rust": "The Rust Book, Rust by Example",
+    "php": "PHP Manual, PSR standards"
+}
+
+# Used as the resource link when the model response can't be used
+FALLBACK_DOC_URL = {
+    "python": "https://docs.python.org/3/tutorial/",
+    "javascript": "https://developer.mozilla.org/",
+    "java": "https://docs.oracle.com/javase/tutorial/",
+    "cpp": "https://en.cppreference.com/w/cpp",
+    "c": "https://en.cppreference.com/w/c",
+    "go": "https://go.dev/doc/effective_go",
+    "rust": "https://doc.rust-lang.org/book/",
+    "php": "https://www.php.net/manual/en/"
+}
+
+# ------------------- Comment severity indicators -------------------
+HARSH_RE = re.compile(r"\b(bad|wrong|terrible|awful|stupid|inefficient|don['’]?t|never|horrible)\b", re.IGNORECASE)
+NEUTRAL_RE = re.compile(r"\b(consider|might|could|suggest|perhaps)\b", re.IGNORECASE)
+
+# ------------------- Memoized LLM calls -------------------
+# Streamlit reruns the whole script on every interaction; caching on the call inputs
+# keeps identical requests from hitting the Groq API again. Errors propagate (and are
+# not cached) so callers can fall back without pinning a transient failure.
+@st.cache_data(ttl=3600, max_entries=512, show_spinner=False)
+def _cached_feedback(_client, api_key: str, code_snippet: str, original_comment: str, language: str, severity: str, model: str) -> Dict[str, str]:
+    tone_instruction = TONE_INSTRUCTION.get(severity, TONE_INSTRUCTION["constructive"])
+
+    # sanitize code snippet so triple-backticks inside it won't break the prompt formatting
+    safe_code = code_snippet.replace("```", "`\u200b``") if "```" in code_snippet else code_snippet
+
+    # Double braces {{ }} produce literal braces in the f-string. The inner {RESOURCE_EXAMPLES...} is evaluated.
+    prompt = f"""
 You are an experienced senior developer and mentor who excels at giving constructive, empathetic code reviews. Your goal is to transform direct criticism into supportive, educational guidance.
 
 **Code Snippet ({language}):**
@@ -254,7 +320,7 @@ Please provide a response in the following JSON format:
     "positive_rephrasing": "A gentle, encouraging version of the feedback that maintains technical accuracy but uses supportive language",
     "the_why": "A clear explanation of the underlying software engineering principle, performance concern, or best practice",
     "suggested_improvement": "A concrete code example showing the recommended fix",
-    "resource_link": "A real, helpful documentation link or resource relevant to {resource_examples.get(language, 'relevant documentation')}"
+    "resource_link": "A real, helpful documentation link or resource relevant to {RESOURCE_EXAMPLES.get(language, 'relevant documentation')}"
 }}
 
 **Important Guidelines:**
@@ -270,56 +336,83 @@ Please provide a response in the following JSON format:
 Respond only with valid JSON.
 """
 
-        try:
-            response = self.client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": "You are an expert code reviewer and mentor. Always respond with valid JSON containing the requested fields."},
-                    {"role": "user", "content": prompt}
-                ],
-                model=self.model,
-                temperature=0.25,
-                max_tokens=900
-            )
-            response_text = response.choices[0].message.content.strip()
-
-            # Remove surrounding code fences or ```json fences
-            if response_text.startswith('```json'):
-                response_text = response_text[len('```json'):].strip()
-                if response_text.endswith('```'):
-                    response_text = response_text[:-3].strip()
-            elif response_text.startswith('```'):
-                response_text = response_text[3:].strip()
-                if response_text.endswith('```'):
-                    response_text = response_text[:-3].strip()
-
-            # Extract first {...} block (robust heuristic)
-            first_brace = response_text.find('{')
-            last_brace = response_text.rfind('}')
-            json_text = response_text
-            if first_brace != -1 and last_brace != -1 and last_brace > first_brace:
-                json_text = response_text[first_brace:last_brace + 1]
-
-            return json.loads(json_text)
+    response = _client.chat.completions.create(
+        messages=[
+            {"role": "system", "content": "You are an expert code reviewer and mentor. Always respond with valid JSON containing the requested fields."},
+            {"role": "user", "content": prompt}
+        ],
+        model=model,
+        # Deterministic sampling so identical inputs give identical output, which is what
+        # makes the response caches valid; a feedback object rarely exceeds ~250 tokens
+        temperature=0.0,
+        top_p=1.0,
+        seed=42,
+        max_tokens=450,
+        response_format={"type": "json_object"}
+    )
+    # JSON mode constrains decoding to a single valid object, so no fence stripping is needed
+    return _json.loads(response.choices[0].message.content)
+
+@st.cache_data(ttl=3600, max_entries=512, show_spinner=False)
+def _cached_batch_feedback(_client, api_key: str, code_snippet: str, comments: Tuple[str, ...], severities: Tuple[str, ...], language: str, model: str) -> List[Dict[str, str]]:
+    # One request for every comment: the code snippet and instructions are sent once
+    # instead of once per comment.
+    safe_code = code_snippet.replace("```", "`\u200b``") if "```" in code_snippet else code_snippet
+    numbered_comments = "\n".join(
+        f'{i}. "{comment}" (be {TONE_INSTRUCTION.get(severity, TONE_INSTRUCTION["constructive"])})'
+        for i, (comment, severity) in enumerate(zip(comments, severities), 1)
+    )
+
+    prompt = f"""
+You are an experienced senior developer and mentor who excels at giving constructive, empathetic code reviews. Your goal is to transform direct criticism into supportive, educational guidance.
 
-        except json.JSONDecodeError as e:
-            st.error(f"JSON parsing error: {e}. Returning safe fallback.")
-            return {
-                "positive_rephrasing": "Let's explore how we can enhance this aspect of the code together.",
-                "the_why": "This improvement follows software engineering best practices for maintainable and readable code.",
-                "suggested_improvement": "// Example improvement (language-dependent) would go here",
-                "resource_link": "https://docs.python.org/3/tutorial/" if language == "python" else "https://developer.mozilla.org/"
-            }
-        except Exception as e:
-            st.error(f"API call error: {e}")
-            return {
-                "positive_rephrasing": "There's a great opportunity to enhance this code.",
-                "the_why": "Following established patterns improves code quality and maintainability.",
-                "suggested_improvement": f"// Code improvement example for {language}",
-                "resource_link": "https://docs.python.org/3/tutorial/" if language == "python" else "https://developer.mozilla.org/"
-            }
+**Code Snippet ({language}):**
+```{language}
+{safe_code}
+```
+
+**Original Comments:**
+{numbered_comments}
+
+For each comment, provide an object in the following JSON format:
+{{
+    "positive_rephrasing": "A gentle, encouraging version of the feedback that maintains technical accuracy but uses supportive language, in the tone given next to the comment",
+    "the_why": "A clear explanation of the underlying software engineering principle, performance concern, or best practice",
+    "suggested_improvement": "A concrete code example showing the recommended fix",
+    "resource_link": "A real, helpful documentation link or resource relevant to {RESOURCE_EXAMPLES.get(language, 'relevant documentation')}"
+}}
 
-    def generate_holistic_summary(self, code_snippet: str, all_feedback: List[Dict], language: str) -> str:
-        prompt = f"""
+**Important Guidelines:**
+- Focus on growth and learning opportunities
+- Explain the reasoning behind best practices
+- Provide specific, actionable improvements
+- Use collaborative language ("we", "let's") when appropriate
+- Acknowledge what's working well before suggesting improvements
+- Make sure each code example is syntactically correct and directly addresses its comment
+- Keep explanations concise but comprehensive
+
+Return a JSON object with an "items" array of exactly {len(comments)} objects, one per comment and in the same order. Respond only with valid JSON.
+"""
+
+    response = _client.chat.completions.create(
+        messages=[
+            {"role": "system", "content": "You are an expert code reviewer and mentor. Always respond with valid JSON containing the requested fields."},
+            {"role": "user", "content": prompt}
+        ],
+        model=model,
+        temperature=0.0,
+        top_p=1.0,
+        seed=42,
+        max_tokens=min(450 * len(comments), 6000),
+        response_format={"type": "json_object"}
+    )
+    items = _json.loads(response.choices[0].message.content).get("items")
+    if not isinstance(items, list) or len(items) != len(comments) or not all(isinstance(item, dict) for item in items):
+        raise ValueError(f"expected an items array of {len(comments)} feedback objects")
+    return items
+
+def _summary_prompt(code_snippet: str, all_feedback: List[Dict], language: str) -> str:
+    return f"""
 Based on the code review feedback provided for this {language} code snippet, write an encouraging and supportive concluding paragraph that:
 
 1. Acknowledges the developer's effort and current implementation
@@ -337,24 +430,197 @@ Based on the code review feedback provided for this {language} code snippet, wri
 
 Write a warm, encouraging paragraph (3-5 sentences) that would make a developer feel supported and motivated to implement the suggestions.
 """
+
+def _digest(*parts: str) -> str:
+    # Compact session-cache key, so full code snippets and API keys aren't used as dict keys
+    return hashlib.blake2b("\0".join(parts).encode(), digest_size=16).hexdigest()
+
+# ------------------- Main App Logic -------------------
+class EmpatheticCodeReviewer:
+    def __init__(self, groq_api_key: str):
+        self.client = _get_groq_client(groq_api_key)
+        self.api_key = groq_api_key
+        self.model = "llama3-8b-8192"
+        # Route by severity: the small model handles routine rephrasing quickly, while harsh
+        # comments (and the closing summary) get the larger model for more nuanced empathy.
+        self.models = {"harsh": "llama-3.3-70b-versatile", "neutral": "llama3-8b-8192", "constructive": "llama3-8b-8192"}
+        self.summary_model = "llama-3.3-70b-versatile"
+
+    def _disk_key(self, model: str, *parts: str) -> Optional[str]:
+        # Mock output is never persisted, so it can't shadow real responses later on
+        if _CACHE is None or isinstance(self.client, MockGroq):
+            return None
+        return hashlib.sha256("\0".join((model,) + parts).encode()).hexdigest()
+
+    @staticmethod
+    def _trim_code(code: str, max_chars: int = 2000) -> str:
+        # Keep head and tail of long snippets: every per-comment request re-sends the code
+        if len(code) <= max_chars:
+            return code
+        return code[:max_chars // 2] + "\n... [elided] ...\n" + code[-(max_chars // 2):]
+
+    def analyze_comment_severity(self, comment: str) -> str:
+        if HARSH_RE.search(comment):
+            return "harsh"
+        elif NEUTRAL_RE.search(comment):
+            return "neutral"
+        else:
+            return "constructive"
+
+    def get_language_from_code(self, code_snippet: str) -> str:
+        # Code that parses as Python is Python; other languages fail on the first line or two
+        try:
+            ast.parse(code_snippet)
+            return "python"
+        except (SyntaxError, ValueError, RecursionError):
+            pass
+        # Cheap substring checks settle the unambiguous cases before any regex runs
+        if "<?php" in code_snippet:
+            return "php"
+        if "#include" in code_snippet:
+            return "cpp" if "std::" in code_snippet or "cout" in code_snippet else "c"
+        if "package " in code_snippet and "func " in code_snippet:
+            return "go"
+        hits = Counter(m.lastgroup for m in LANGUAGE_RE.finditer(code_snippet))
+        if not hits:
+            return "python"
+        # Most hits wins; ties go to the language listed first in LANGUAGE_PATTERNS
+        return max(LANGUAGE_PATTERNS, key=lambda lang: hits[lang])
+
+    def generate_empathetic_feedback(self, code_snippet: str, original_comment: str, language: str, severity: str) -> Dict[str, str]:
+        # Session-level cache keyed on a digest of the inputs, so reruns never re-request
+        # feedback this session has already received (fallbacks below are not stored).
+        model = self.models.get(severity, self.model)
+        key = _digest(self.api_key, model, code_snippet, original_comment, language)
+        feedback_cache = st.session_state.setdefault("feedback_cache", {})
+        if key in feedback_cache:
+            return feedback_cache[key]
+        disk_key = self._disk_key(model, language, severity, code_snippet, original_comment)
+        if disk_key is not None and disk_key in _CACHE:
+            feedback_cache[key] = _CACHE[disk_key]
+            return feedback_cache[key]
+        try:
+            feedback = _cached_feedback(self.client, self.api_key, self._trim_code(code_snippet), original_comment, language, severity, model)
+            feedback_cache[key] = feedback
+            if disk_key is not None:
+                _CACHE.set(disk_key, feedback)
+            return feedback
+        except json.JSONDecodeError as e:
+            st.error(f"JSON parsing error: {e}. Returning safe fallback.")
+            return {
+                "positive_rephrasing": "Let's explore how we can enhance this aspect of the code together.",
+                "the_why": "This improvement follows software engineering best practices for maintainable and readable code.",
+                "suggested_improvement": "// Example improvement (language-dependent) would go here",
+                "resource_link": FALLBACK_DOC_URL.get(language, "https://developer.mozilla.org/")
+            }
+        except Exception as e:
+            st.error(f"API call error: {e}")
+            return {
+                "positive_rephrasing": "There's a great opportunity to enhance this code.",
+                "the_why": "Following established patterns improves code quality and maintainability.",
+                "suggested_improvement": f"// Code improvement example for {language}",
+                "resource_link": FALLBACK_DOC_URL.get(language, "https://developer.mozilla.org/")
+            }
+
+    def generate_all_feedback(self, code_snippet: str, comments: List[str], severities: List[str], language: str,
+                              on_progress: Optional[Callable[[int], None]] = None) -> List[Dict[str, str]]:
+        # A batch containing a harsh comment goes to the larger model as a whole
+        model = self.models["harsh"] if "harsh" in severities else self.model
+        disk_key = self._disk_key(model, "batch", language, code_snippet, *comments, *severities)
+        if disk_key is not None and disk_key in _CACHE:
+            if on_progress:
+                on_progress(len(comments))
+            return _CACHE[disk_key]
+        try:
+            all_feedback = _cached_batch_feedback(self.client, self.api_key, code_snippet, tuple(comments), tuple(severities), language, model)
+            if disk_key is not None:
+                _CACHE.set(disk_key, all_feedback)
+            if on_progress:
+                on_progress(len(comments))
+            return all_feedback
+        except Exception as e:
+            st.warning(f"Batched feedback request failed ({e}). Requesting each comment separately.")
+
+        # Fallback: one request per comment. The calls are independent and network-bound,
+        # so issue them concurrently. Worker threads get the script context so st.error /
+        # st.cache_data / st.session_state keep working.
+        all_feedback = [None] * len(comments)
+        ctx = get_script_run_ctx()
+        with ThreadPoolExecutor(
+            max_workers=min(len(comments), 8),
+            initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx),
+        ) as executor:
+            futures = {
+                executor.submit(self.generate_empathetic_feedback, code_snippet, c, language, sev): i
+                for i, (c, sev) in enumerate(zip(comments, severities))
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                all_feedback[futures[future]] = future.result()
+                if on_progress:
+                    on_progress(done)
+        return all_feedback
+
+    def generate_holistic_summary(self, code_snippet: str, all_feedback: List[Dict], language: str,
+                                  placeholder=None) -> str:
+        # Streamed so the summary shows up token by token in `placeholder`. A streaming call
+        # can't live inside st.cache_data (it would replay UI updates), so finished
+        # summaries are kept in a session-level cache like the per-comment feedback.
+        key = _digest(self.api_key, self.summary_model, code_snippet, language, str(len(all_feedback)))
+        summary_cache = st.session_state.setdefault("summary_cache", {})
+        if key in summary_cache:
+            return summary_cache[key]
+        disk_key = self._disk_key(self.summary_model, "summary", language, code_snippet, str(len(all_feedback)))
+        if disk_key is not None and disk_key in _CACHE:
+            summary_cache[key] = _CACHE[disk_key]
+            return summary_cache[key]
         try:
             response = self.client.chat.completions.create(
                 messages=[
                     {"role": "system", "content": "You are a supportive senior developer providing encouraging feedback. Write in a warm, mentoring tone."},
-                    {"role": "user", "content": prompt}
+                    {"role": "user", "content": _summary_prompt(code_snippet, all_feedback, language)}
                 ],
-                model=self.model,
+                model=self.summary_model,
                 temperature=0.4,
-                max_tokens=300
+                max_tokens=220,
+                stream=True
             )
-            return response.choices[0].message.content.strip()
+            buffer = ""
+            for chunk in response:
+                buffer += chunk.choices[0].delta.content or ""
+                if placeholder is not None:
+                    placeholder.markdown(buffer)
+            summary = buffer.strip()
+            summary_cache[key] = summary
+            if disk_key is not None:
+                _CACHE.set(disk_key, summary)
+            return summary
         except Exception as e:
             st.error(f"Error generating summary: {e}")
             return "Great work on this implementation! The feedback above provides some excellent opportunities to enhance your code's performance, readability, and adherence to best practices. Keep iterating and learning!"
 
+@st.cache_resource(show_spinner=False)
+def get_reviewer(api_key: str) -> EmpatheticCodeReviewer:
+    # The reviewer holds the API client, so keep one per key across reruns and sessions
+    return EmpatheticCodeReviewer(api_key)
+
+# ------------------- Helper: Markdown report -------------------
+@st.cache_data(max_entries=32, show_spinner=False)
+def _build_markdown(snapshot: tuple) -> str:
+    # Keyed on a hashable snapshot of the results, so reruns reuse the built report
+    generated_at, code_snippet, language, comments, feedback, summary = snapshot
+    parts = [f"# 🌟 Empathetic Code Review Report\n\nGenerated on: {generated_at}\n\n## Original Code ({language.title()})\n\n```{language}\n{code_snippet}\n```\n\n## Constructive Feedback\n\n"]
+    for i, (original_comment, (positive_rephrasing, the_why, suggested_improvement, resource_link)) in enumerate(zip(comments, feedback), 1):
+        parts.append(f"### 💡 Analysis of Comment {i}: \"{original_comment}\"\n\n**🤝 Positive Rephrasing:** {positive_rephrasing}\n\n**🧠 The 'Why':** {the_why}\n\n**🔧 Suggested Improvement:**\n```{language}\n{suggested_improvement}\n```\n\n**📚 Learn More:** [{resource_link}]\n\n---\n\n")
+    parts.append(f"## 🎉 Summary\n\n{summary}\n\n*Happy coding! 🚀*\n")
+    return "".join(parts)
+
 # ------------------- Helper: Download link -------------------
+@st.cache_data(show_spinner=False)
+def _b64(content: bytes) -> str:
+    return base64.b64encode(content).decode()
+
 def create_download_link(content: str, filename: str, link_text: str) -> str:
-    b64 = base64.b64encode(content.encode()).decode()
+    b64 = _b64(content.encode())
     return f'<a href="data:file/markdown;base64,{b64}" download="{filename}" class="download-link">{link_text}</a>'
 
 # ------------------- Sidebar Rubric & Config -------------------
@@ -379,15 +645,94 @@ with st.sidebar:
     if st.button("📝 Load Sample Data", use_container_width=True):
         st.session_state.sample_loaded = True
 
+# ------------------- Report -------------------
+# Rendered as a fragment: interactions inside the report (e.g. the download button)
+# rerun only this function instead of the whole page.
+@st.fragment
+def render_report():
+    results = st.session_state.results
+    st.markdown("---")
+    st.markdown("## 📊 Empathetic Review Report")
+
+    # Metric cards, emitted as a single grid so the report sends one element instead of four
+    harsh_comments = sum(s == "harsh" for s in results['severities'])
+    cards = [
+        ("🔍 Language", results['language'].title(), ""),
+        ("⚠️ Harsh", harsh_comments, "Detected harsh comments"),
+        ("💬 Comments", len(results['comments']), "Total comments"),
+        ("✨ Improvements", len(results['feedback']), "Suggestions generated"),
+    ]
+    cards_html = "".join(
+        f'<div class="metric-card"><h4>{title}</h4>'
+        f'<div style="font-weight:700; font-size:18px;">{value}</div>'
+        + (f'<div style="color:var(--muted); font-size:12px;">{caption}</div>' if caption else "")
+        + "</div>"
+        for title, value, caption in cards
+    )
+    st.markdown(f'<div style="display:grid; grid-template-columns:repeat(4, 1fr); gap:1rem;">{cards_html}</div>', unsafe_allow_html=True)
+
+    st.markdown("---")
+    st.markdown("### 💻 Original Code")
+    st.code(results['code_snippet'], language=results['language'])
+
+    st.markdown("### 🤝 Constructive Feedback")
+    for i, (original_comment, feedback) in enumerate(zip(results['comments'], results['feedback']), 1):
+        with st.expander(f"💡 Comment {i}: \"{original_comment[:60]}{'...' if len(original_comment) > 60 else ''}\"", expanded=True):
+            left, right = st.columns([1,1])
+            with left:
+                st.markdown("**🤝 Positive Rephrasing:**")
+                st.info(feedback.get('positive_rephrasing', '—'))
+                st.markdown("**🧠 The 'Why':**")
+                st.write(feedback.get('the_why', '—'))
+            with right:
+                st.markdown("**🔧 Suggested Improvement:**")
+                st.code(feedback.get('suggested_improvement', ''), language=results['language'])
+                st.markdown("**📚 Learn More:**")
+                resource = feedback.get('resource_link', '')
+                if isinstance(resource, str) and resource.startswith('http'):
+                    st.markdown(f"[📖 Documentation Link]({resource})")
+                else:
+                    st.write(resource)
+
+    st.markdown("### 🎉 Summary")
+    st.success(results['summary'])
+
+    # Download
+    st.markdown("### 📥 Download Report")
+    markdown_content = _build_markdown((
+        results['generated_at'],
+        results['code_snippet'],
+        results['language'],
+        tuple(results['comments']),
+        tuple((fb.get('positive_rephrasing', ''), fb.get('the_why', ''), fb.get('suggested_improvement', ''), fb.get('resource_link', '')) for fb in results['feedback']),
+        results['summary'],
+    ))
+    filename = f"empathetic_review_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
+    st.download_button(label="📄 Download Markdown Report", data=markdown_content, file_name=filename, mime="text/markdown", use_container_width=True)
+
+    # --- Rubric scoring widget (helps you demonstrate scoring & innovation) ---
+    st.markdown("---")
+    # st.markdown("## 🧮 Self-Evaluation (Demo judge panel)")
+    # colA, colB = st.columns(2)
+    # with colA:
+    #     f_score = st.slider("Functionality & Correctness (0-25)", 0, 25, 20)
+    #     ai_score = st.slider("AI Output & Prompting (0-45)", 0, 45, 36)
+    # with colB:
+    #     code_score = st.slider("Code Quality & Documentation (0-20)", 0, 20, 16)
+    #     innov_score = st.slider("Innovation & Stand Out (0-10)", 0, 10, 6)
+
+    # total = f_score + ai_score + code_score + innov_score
+    # st.markdown(f"**Total (weighted)**: <span style='font-weight:800; font-size:20px; color:var(--accent)'> {total} / 100</span>", unsafe_allow_html=True)
+    # if total >= 85:
+    #     st.success("🏆 Excellent — this would score highly in the judging rubric!")
+    # elif total >= 65:
+    #     st.info("👍 Strong — good job, consider adding an extra stand-out feature.")
+    # else:
+    #     st.warning("🔧 Needs work — focus on improving AI output depth and functionality.")
+
 # ------------------- Main UI -------------------
 def main():
-    st.markdown("""
-    <div class="main-header">
-        <h1> CodeRev</h1>
-        <p><strong>Transforming Critical Feedback into Constructive Growth</strong></p>
-        <p style="opacity:0.9;">Turn blunt comments into supportive, educational guidance using generative AI.</p>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(HEADER_HTML, unsafe_allow_html=True)
 
     col1, col2 = st.columns([1, 1])
 
@@ -415,17 +760,10 @@ def main():
                 "Variable 'u' is a bad name.",
                 "Boolean comparison '== True' is redundant."
             ]
-        if 'num_comments' not in st.session_state:
-            st.session_state.num_comments = len(sample_comments) if sample_comments else 3
-        num_comments = st.number_input("Number of Comments", min_value=1, max_value=10, value=st.session_state.num_comments)
-        st.session_state.num_comments = num_comments
-
-        comments = []
-        for i in range(num_comments):
-            default_comment = sample_comments[i] if i < len(sample_comments) else ""
-            comment = st.text_input(f"Comment {i+1}", value=default_comment, key=f"comment_{i}")
-            if comment and comment.strip():
-                comments.append(comment.strip())
+        # One text area (a comment per line) instead of a text_input per comment
+        raw_comments = st.text_area("Review Comments (one per line, up to 10)", value="\n".join(sample_comments), height=160,
+                                    placeholder="Paste one review comment per line...")
+        comments = [c.strip() for c in raw_comments.splitlines() if c.strip()][:10]
 
     with col2:
         st.markdown("## 🎯 Analysis & Results")
@@ -439,22 +777,25 @@ def main():
             if st.button("🚀 Generate Empathetic Review", type="primary", use_container_width=True):
                 try:
                     with st.spinner("🤖 Generating empathetic feedback..."):
-                        reviewer = EmpatheticCodeReviewer(api_key or "")
+                        reviewer = get_reviewer(api_key or "")
                         detected_language = reviewer.get_language_from_code(code_snippet) if selected_language == "Auto-detect" else selected_language.lower()
                         progress_bar = st.progress(0)
                         status_text = st.empty()
 
-                        all_feedback = []
                         total_comments = len(comments)
-                        for i, comment in enumerate(comments):
-                            status_text.text(f"Processing comment {i+1}/{total_comments}...")
-                            severity = reviewer.analyze_comment_severity(comment)
-                            feedback = reviewer.generate_empathetic_feedback(code_snippet, comment, detected_language, severity)
-                            all_feedback.append(feedback)
-                            progress_bar.progress((i + 1) / (total_comments + 1))
+                        severities = [reviewer.analyze_comment_severity(c) for c in comments]
+                        status_text.text(f"Processing {total_comments} comments...")
+
+                        def on_progress(done: int):
+                            status_text.text(f"Processed comment {done}/{total_comments}...")
+                            progress_bar.progress(done / (total_comments + 1))
+
+                        all_feedback = reviewer.generate_all_feedback(code_snippet, comments, severities, detected_language, on_progress)
 
                         status_text.text("Generating holistic summary...")
-                        summary = reviewer.generate_holistic_summary(code_snippet, all_feedback, detected_language)
+                        summary_placeholder = st.empty()
+                        summary = reviewer.generate_holistic_summary(code_snippet, all_feedback, detected_language, summary_placeholder)
+                        summary_placeholder.empty()
                         progress_bar.progress(1.0)
                         status_text.text("✅ Analysis complete!")
 
@@ -462,107 +803,17 @@ def main():
                             'code_snippet': code_snippet,
                             'language': detected_language,
                             'comments': comments,
+                            'severities': severities,
                             'feedback': all_feedback,
-                            'summary': summary
+                            'summary': summary,
+                            'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                         }
                 except Exception as e:
                     st.error(f"❌ Error: {str(e)}")
 
     # Results display
     if 'results' in st.session_state:
-        st.markdown("---")
-        st.markdown("## 📊 Empathetic Review Report")
-        results = st.session_state.results
-
-        # Metric cards
-        mcol1, mcol2, mcol3, mcol4 = st.columns(4)
-        with mcol1:
-            st.markdown(f"""
-            <div class="metric-card">
-                <h4>🔍 Language</h4>
-                <div style="font-weight:700; font-size:18px;">{results['language'].title()}</div>
-            </div>
-            """, unsafe_allow_html=True)
-        with mcol2:
-            harsh_comments = sum(1 for comment in results['comments'] if EmpatheticCodeReviewer("").analyze_comment_severity(comment) == "harsh")
-            st.markdown(f"""
-            <div class="metric-card">
-                <h4>⚠️ Harsh</h4>
-                <div style="font-weight:700; font-size:18px;">{harsh_comments}</div>
-                <div style="color:var(--muted); font-size:12px;">Detected harsh comments</div>
-            </div>
-            """, unsafe_allow_html=True)
-        with mcol3:
-            st.markdown(f"""
-            <div class="metric-card">
-                <h4>💬 Comments</h4>
-                <div style="font-weight:700; font-size:18px;">{len(results['comments'])}</div>
-                <div style="color:var(--muted); font-size:12px;">Total comments</div>
-            </div>
-            """, unsafe_allow_html=True)
-        with mcol4:
-            st.markdown(f"""
-            <div class="metric-card">
-                <h4>✨ Improvements</h4>
-                <div style="font-weight:700; font-size:18px;">{len(results['feedback'])}</div>
-                <div style="color:var(--muted); font-size:12px;">Suggestions generated</div>
-            </div>
-            """, unsafe_allow_html=True)
-
-        st.markdown("---")
-        st.markdown("### 💻 Original Code")
-        st.code(results['code_snippet'], language=results['language'])
-
-        st.markdown("### 🤝 Constructive Feedback")
-        for i, (original_comment, feedback) in enumerate(zip(results['comments'], results['feedback']), 1):
-            with st.expander(f"💡 Comment {i}: \"{original_comment[:60]}{'...' if len(original_comment) > 60 else ''}\"", expanded=True):
-                left, right = st.columns([1,1])
-                with left:
-                    st.markdown("**🤝 Positive Rephrasing:**")
-                    st.info(feedback.get('positive_rephrasing', '—'))
-                    st.markdown("**🧠 The 'Why':**")
-                    st.write(feedback.get('the_why', '—'))
-                with right:
-                    st.markdown("**🔧 Suggested Improvement:**")
-                    st.code(feedback.get('suggested_improvement', ''), language=results['language'])
-                    st.markdown("**📚 Learn More:**")
-                    resource = feedback.get('resource_link', '')
-                    if isinstance(resource, str) and resource.startswith('http'):
-                        st.markdown(f"[📖 Documentation Link]({resource})")
-                    else:
-                        st.write(resource)
-
-        st.markdown("### 🎉 Summary")
-        st.success(results['summary'])
-
-        # Download
-        st.markdown("### 📥 Download Report")
-        markdown_content = f"# 🌟 Empathetic Code Review Report\n\nGenerated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n## Original Code ({results['language'].title()})\n\n```{results['language']}\n{results['code_snippet']}\n```\n\n## Constructive Feedback\n\n"
-        for i, (original_comment, feedback) in enumerate(zip(results['comments'], results['feedback']), 1):
-            markdown_content += f"### 💡 Analysis of Comment {i}: \"{original_comment}\"\n\n**🤝 Positive Rephrasing:** {feedback.get('positive_rephrasing','')}\n\n**🧠 The 'Why':** {feedback.get('the_why','')}\n\n**🔧 Suggested Improvement:**\n```{results['language']}\n{feedback.get('suggested_improvement','')}\n```\n\n**📚 Learn More:** [{feedback.get('resource_link','')}]\n\n---\n\n"
-        markdown_content += f"## 🎉 Summary\n\n{results['summary']}\n\n*Happy coding! 🚀*\n"
-        filename = f"empathetic_review_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
-        st.download_button(label="📄 Download Markdown Report", data=markdown_content, file_name=filename, mime="text/markdown", use_container_width=True)
-
-        # --- Rubric scoring widget (helps you demonstrate scoring & innovation) ---
-        st.markdown("---")
-        # st.markdown("## 🧮 Self-Evaluation (Demo judge panel)")
-        # colA, colB = st.columns(2)
-        # with colA:
-        #     f_score = st.slider("Functionality & Correctness (0-25)", 0, 25, 20)
-        #     ai_score = st.slider("AI Output & Prompting (0-45)", 0, 45, 36)
-        # with colB:
-        #     code_score = st.slider("Code Quality & Documentation (0-20)", 0, 20, 16)
-        #     innov_score = st.slider("Innovation & Stand Out (0-10)", 0, 10, 6)
-
-        # total = f_score + ai_score + code_score + innov_score
-        # st.markdown(f"**Total (weighted)**: <span style='font-weight:800; font-size:20px; color:var(--accent)'> {total} / 100</span>", unsafe_allow_html=True)
-        # if total >= 85:
-        #     st.success("🏆 Excellent — this would score highly in the judging rubric!")
-        # elif total >= 65:
-        #     st.info("👍 Strong — good job, consider adding an extra stand-out feature.")
-        # else:
-        #     st.warning("🔧 Needs work — focus on improving AI output depth and functionality.")
+        render_report()
 
 if __name__ == "__main__":
     if 'sample_loaded' not in st.session_state: